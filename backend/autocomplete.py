@@ -0,0 +1,471 @@
+"""In-memory autocomplete index for prefix lookups on contacts.
+
+Keeps sorted, array-backed columns of normalized names, emails and phone
+digits so `GET /contacts/suggest` is answered by binary search without a
+database round trip. The index is per process: with several workers, each
+one only sees the writes it handled itself.
+"""
+# autocomplete.py
+# (1) Enable with AUTOCOMPLETE_INDEX=1; the index is built on startup and
+#     kept current by the write endpoints.
+# (2) Benchmark: python bench_autocomplete.py --contacts 100000
+
+import bisect
+import heapq
+import os
+import re
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, or_
+from sqlmodel import Session, select
+
+import database
+from models import Contact
+
+AUTOCOMPLETE_ENABLED = os.getenv("AUTOCOMPLETE_INDEX", "").lower() in ("1", "true", "yes")
+
+FIELDS = ("name", "email", "phone")
+
+# Stored row: (name, email, phone) exactly as saved in the database
+Row = Tuple[str, str, str]
+
+# Compact once the overlay holds this fraction of the snapshot (or
+# `compact_threshold` rows, whichever is more), so rebuild cost per write
+# stays constant as the index grows instead of scaling with its size.
+COMPACT_FRACTION = 10
+
+_ROW_SEPARATOR = "\x1f"
+_NON_DIGITS = re.compile(r"\D+")
+# Separators `ContactBase.validate_phone` allows; stripping them leaves only digits
+_PHONE_SEPARATORS = (" ", "\t", "-", "(", ")", "+")
+
+
+# --- Normalization ---
+
+def normalize_text(value: str) -> str:
+    """Case-fold and collapse whitespace."""
+    return " ".join(value.casefold().split())
+
+
+def normalize_phone(value: str) -> str:
+    """Keep only the digits of a phone number."""
+    return _NON_DIGITS.sub("", value)
+
+
+def index_keys(row: Row) -> Dict[str, List[bytes]]:
+    """Return the keys a row is indexed under, per field.
+
+    Names are also indexed from each later word, so "smi" finds "John Smith".
+    """
+    name, email, phone = row
+    words = normalize_text(name).split(" ")
+    name_keys = [" ".join(words[i:]) for i in range(len(words)) if words[i]]
+    phone_key = normalize_phone(phone)
+    return {
+        "name": [key.encode() for key in dict.fromkeys(name_keys)],
+        "email": [normalize_text(email).encode()],
+        "phone": [phone_key.encode()] if phone_key else [],
+    }
+
+
+def query_keys(prefix: str) -> Dict[str, bytes]:
+    """Normalize a user-typed prefix for each field; fields it cannot match are omitted."""
+    keys = {}
+    text = normalize_text(prefix)
+    if text:
+        keys["name"] = text.encode()
+        keys["email"] = text.encode()
+    digits = normalize_phone(prefix)
+    if digits:
+        keys["phone"] = digits.encode()
+    return keys
+
+
+def _compact_array(values: List[int]) -> array:
+    """Pack non-negative ints into the smallest unsigned array that fits."""
+    limit = max(values, default=0)
+    return array("I" if limit < 2 ** 32 else "Q", values)
+
+
+def _array_bytes(values: array) -> int:
+    return values.itemsize * len(values)
+
+
+# --- Immutable snapshot ---
+
+class _Column:
+    """Sorted keys packed into one bytes blob, each pointing at a row number."""
+
+    def __init__(self, entries: List[Tuple[bytes, int]]):
+        entries.sort()
+        self.keys = b"".join(key for key, _ in entries)
+        offsets = [0]
+        for key, _ in entries:
+            offsets.append(offsets[-1] + len(key))
+        self.offsets = _compact_array(offsets)
+        self.rows = _compact_array([row for _, row in entries])
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def key(self, i: int) -> bytes:
+        return self.keys[self.offsets[i]:self.offsets[i + 1]]
+
+    def _lower_bound(self, target: bytes) -> int:
+        lo, hi = 0, len(self.rows)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def prefix_range(self, prefix: bytes) -> range:
+        """Positions of all keys starting with `prefix` (0xff never occurs in UTF-8)."""
+        return range(self._lower_bound(prefix), self._lower_bound(prefix + b"\xff"))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.keys) + _array_bytes(self.offsets) + _array_bytes(self.rows)
+
+
+class _Snapshot:
+    """Read-only index over a fixed set of rows, sorted by contact id."""
+
+    def __init__(self, rows: Iterable[Tuple[int, Row]]):
+        ordered = sorted(rows)
+        self.ids = array("q", [contact_id for contact_id, _ in ordered])
+        encoded = [_ROW_SEPARATOR.join(v.replace(_ROW_SEPARATOR, " ") for v in row).encode()
+                   for _, row in ordered]
+        self.row_blob = b"".join(encoded)
+        offsets = [0]
+        for data in encoded:
+            offsets.append(offsets[-1] + len(data))
+        self.row_offsets = _compact_array(offsets)
+
+        entries: Dict[str, List[Tuple[bytes, int]]] = {field: [] for field in FIELDS}
+        for position, (_, row) in enumerate(ordered):
+            for field, keys in index_keys(row).items():
+                entries[field].extend((key, position) for key in keys)
+        self.columns = {field: _Column(entries[field]) for field in FIELDS}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def row(self, position: int) -> Row:
+        data = self.row_blob[self.row_offsets[position]:self.row_offsets[position + 1]]
+        return tuple(data.decode().split(_ROW_SEPARATOR))
+
+    def get(self, contact_id: int) -> Optional[Row]:
+        position = bisect.bisect_left(self.ids, contact_id)
+        if position < len(self.ids) and self.ids[position] == contact_id:
+            return self.row(position)
+        return None
+
+    def items(self) -> Iterable[Tuple[int, Row]]:
+        for position, contact_id in enumerate(self.ids):
+            yield contact_id, self.row(position)
+
+    @property
+    def nbytes(self) -> int:
+        total = len(self.row_blob) + _array_bytes(self.ids) + _array_bytes(self.row_offsets)
+        return total + sum(column.nbytes for column in self.columns.values())
+
+
+# --- Mutable overlay ---
+
+class _Overlay:
+    """Recent writes not yet compacted into the snapshot. `None` marks a deletion."""
+
+    def __init__(self):
+        self.rows: Dict[int, Optional[Row]] = {}
+        self.keys: Dict[str, List[Tuple[bytes, int]]] = {field: [] for field in FIELDS}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _unindex(self, contact_id: int) -> None:
+        old = self.rows.get(contact_id)
+        if old is not None:
+            for field, keys in index_keys(old).items():
+                for key in keys:
+                    self.keys[field].remove((key, contact_id))
+
+    def put(self, contact_id: int, row: Optional[Row]) -> None:
+        self._unindex(contact_id)
+        self.rows[contact_id] = row
+        if row is not None:
+            for field, keys in index_keys(row).items():
+                for key in keys:
+                    bisect.insort(self.keys[field], (key, contact_id))
+
+    def prefix_entries(self, field: str, prefix: bytes) -> List[Tuple[bytes, int]]:
+        entries = self.keys[field]
+        lo = bisect.bisect_left(entries, (prefix,))
+        hi = bisect.bisect_left(entries, (prefix + b"\xff",))
+        return entries[lo:hi]
+
+
+class AutocompleteIndex:
+    """Prefix index over contact names, emails and phone digits.
+
+    Reads merge three layers, newest first: the active overlay of recent
+    writes, an overlay being compacted (if any), and the packed snapshot.
+    Once the active overlay reaches `compact_threshold` rows, or a tenth of the
+    snapshot if that is larger, it is folded into a new snapshot on a
+    background thread.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[int, Row]] = (), compact_threshold: int = 4096):
+        self.compact_threshold = compact_threshold
+        self._snapshot = _Snapshot(rows)
+        self._active = _Overlay()
+        self._frozen: Optional[_Overlay] = None
+        self._lock = threading.Lock()
+        self._compactor: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_contacts(cls, contacts: Iterable[Contact], **kwargs) -> "AutocompleteIndex":
+        return cls(((c.id, (c.name, c.email, c.phone)) for c in contacts), **kwargs)
+
+    # --- Writes ---
+
+    def upsert(self, contact: Contact) -> None:
+        """Index a created or updated contact."""
+        self._put(contact.id, (contact.name, contact.email, contact.phone))
+
+    def remove(self, contact_id: int) -> None:
+        """Drop a deleted contact from the index."""
+        self._put(contact_id, None)
+
+    def _put(self, contact_id: int, row: Optional[Row]) -> None:
+        with self._lock:
+            self._active.put(contact_id, row)
+            self._maybe_start_compaction()
+
+    def _maybe_start_compaction(self) -> None:
+        """Hand the active overlay to a compaction thread if it is due. Caller holds the lock."""
+        threshold = max(self.compact_threshold, len(self._snapshot) // COMPACT_FRACTION)
+        if len(self._active) >= threshold and self._frozen is None:
+            self._frozen, self._active = self._active, _Overlay()
+            # Started under the lock so compact() never joins an unstarted thread
+            self._compactor = threading.Thread(target=self._compact, name="autocomplete-compact", daemon=True)
+            self._compactor.start()
+
+    def _compact(self) -> None:
+        snapshot, frozen = self._snapshot, self._frozen
+        rebuilt: Optional[_Snapshot] = None
+        try:
+            rows = [(cid, row) for cid, row in snapshot.items() if cid not in frozen.rows]
+            rows += [(cid, row) for cid, row in frozen.rows.items() if row is not None]
+            rebuilt = _Snapshot(rows)
+        except Exception as e:
+            print(f"❌ Autocomplete compaction failed: {e}")
+        finally:
+            with self._lock:
+                if rebuilt is not None:
+                    self._snapshot = rebuilt
+                    self._frozen = None
+                    # Writes that piled up during the rebuild do not wait for the next _put
+                    self._maybe_start_compaction()
+                else:
+                    # Keep the frozen writes; newer ones in the active overlay win
+                    for cid, row in frozen.rows.items():
+                        if cid not in self._active.rows:
+                            self._active.put(cid, row)
+                    self._frozen = None
+
+    def compact(self) -> None:
+        """Fold all pending writes into the snapshot now (blocks until done)."""
+        while True:
+            with self._lock:
+                running = self._compactor if self._frozen is not None else None
+                if running is None:
+                    if not len(self._active):
+                        return
+                    self._frozen, self._active = self._active, _Overlay()
+                    break
+            running.join()
+        self._compact()
+
+    # --- Reads ---
+
+    def get(self, contact_id: int) -> Optional[Row]:
+        with self._lock:
+            for layer in (self._active, self._frozen):
+                if layer is not None and contact_id in layer.rows:
+                    return layer.rows[contact_id]
+            return self._snapshot.get(contact_id)
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[Tuple[int, Row, str]]:
+        """Return up to `limit` `(id, row, matched_field)` results whose name, email or phone starts with `prefix`.
+
+        Name matches come first, then email, then phone; each group is ordered by key.
+        """
+        results: List[Tuple[int, Row, str]] = []
+        seen = set()
+        with self._lock:
+            active, frozen, snapshot = self._active, self._frozen, self._snapshot
+            for field, key in query_keys(prefix).items():
+                if len(results) >= limit:
+                    break
+                for contact_id, row in self._field_matches(field, key, limit, active, frozen, snapshot):
+                    if contact_id in seen:
+                        continue
+                    seen.add(contact_id)
+                    results.append((contact_id, row, field))
+                    if len(results) >= limit:
+                        break
+        return results
+
+    @staticmethod
+    def _field_matches(field, key, limit, active, frozen, snapshot) -> List[Tuple[int, Row]]:
+        layers = [layer for layer in (active, frozen) if layer is not None]
+        candidates: List[List[Tuple[bytes, int, Row]]] = []
+
+        # A contact can match under several keys of one field (e.g. two name
+        # words), so repeats are dropped before counting towards `limit`
+        for depth, layer in enumerate(layers):
+            newer = layers[:depth]
+            from_layer = []
+            taken = set()
+            for k, cid in layer.prefix_entries(field, key):
+                if cid in taken or any(cid in n.rows for n in newer):
+                    continue
+                taken.add(cid)
+                from_layer.append((k, cid, layer.rows[cid]))
+                if len(from_layer) >= limit:
+                    break
+            candidates.append(from_layer)
+
+        column = snapshot.columns[field]
+        from_snapshot = []
+        taken = set()
+        for position in column.prefix_range(key):
+            row_position = column.rows[position]
+            cid = snapshot.ids[row_position]
+            if cid in taken or any(cid in layer.rows for layer in layers):
+                continue
+            taken.add(cid)
+            from_snapshot.append((column.key(position), cid, snapshot.row(row_position)))
+            if len(from_snapshot) >= limit:
+                break
+        candidates.append(from_snapshot)
+
+        matches: List[Tuple[int, Row]] = []
+        seen = set()
+        for _, cid, row in heapq.merge(*candidates):
+            if cid not in seen:
+                seen.add(cid)
+                matches.append((cid, row))
+                if len(matches) >= limit:
+                    break
+        return matches
+
+    def stats(self) -> Dict[str, float]:
+        """Size of the index; `bytes_per_contact` covers the packed snapshot only."""
+        with self._lock:
+            snapshot_contacts = len(self._snapshot)
+            snapshot_bytes = self._snapshot.nbytes
+            pending = len(self._active) + (len(self._frozen) if self._frozen else 0)
+        per_contact = snapshot_bytes / snapshot_contacts if snapshot_contacts else 0.0
+        return {
+            "snapshot_contacts": snapshot_contacts,
+            "snapshot_bytes": snapshot_bytes,
+            "pending_writes": pending,
+            "bytes_per_contact": round(per_contact, 1),
+            "mb_per_million_contacts": round(per_contact * 1_000_000 / 2 ** 20, 1),
+        }
+
+
+# --- SQL fallback ---
+
+def _escape_like(value: str) -> str:
+    """Escape LIKE wildcards so user input only ever matches literally."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _phone_digits(column):
+    """SQL expression for `column` with phone separators removed (see `normalize_phone`)."""
+    for separator in _PHONE_SEPARATORS:
+        column = func.replace(column, separator, "")
+    return column
+
+
+def suggest_query(prefix: str):
+    """Build the `select(Contact)` that finds what `AutocompleteIndex.suggest` would.
+
+    Matches a name or any later name word, an email, or the phone digits
+    starting with `prefix`, case-insensitively and with wildcards escaped.
+
+    Returns:
+        The query, or None if `prefix` cannot match anything
+    """
+    keys = query_keys(prefix)
+    clauses = []
+    if "name" in keys:
+        text = _escape_like(keys["name"].decode())
+        clauses += [
+            Contact.name.ilike(f"{text}%", escape="\\"),
+            Contact.name.ilike(f"% {text}%", escape="\\"),
+            Contact.email.ilike(f"{text}%", escape="\\"),
+        ]
+    if "phone" in keys:
+        clauses.append(_phone_digits(Contact.phone).like(f"{keys['phone'].decode()}%"))
+    if not clauses:
+        return None
+    return select(Contact).where(or_(*clauses))
+
+
+def matched_field(row: Row, prefix: str) -> Optional[str]:
+    """Return the first field ("name", "email", "phone") of `row` that `prefix` matches."""
+    keys = query_keys(prefix)
+    row_keys = index_keys(row)
+    for field in FIELDS:
+        if field in keys and any(key.startswith(keys[field]) for key in row_keys[field]):
+            return field
+    return None
+
+
+# --- Application wiring ---
+
+# Set on startup when AUTOCOMPLETE_INDEX is enabled; None means suggestions come from SQL
+autocomplete_index: Optional[AutocompleteIndex] = None
+
+
+def _load_rows() -> List[Tuple[int, Row]]:
+    query = select(Contact.id, Contact.name, Contact.email, Contact.phone)
+    if database.shard_router is not None:
+        shards = database.shard_router.scatter(lambda session: session.exec(query).all())
+        results = [r for shard in shards for r in shard]
+    else:
+        with Session(database.engine) as session:
+            results = session.exec(query).all()
+    return [(cid, (name, email, phone)) for cid, name, email, phone in results]
+
+
+def init_autocomplete_index() -> None:
+    """Build the autocomplete index from the database if it is enabled.
+
+    Must run after `create_db_and_tables()` so the right engine(s) are in place.
+    """
+    global autocomplete_index
+    if not AUTOCOMPLETE_ENABLED:
+        return
+    autocomplete_index = AutocompleteIndex(_load_rows())
+    stats = autocomplete_index.stats()
+    print(
+        f"✅ Autocomplete index built: {stats['snapshot_contacts']} contacts, "
+        f"{stats['snapshot_bytes'] / 2 ** 20:.1f} MB"
+    )
+
+
+def get_autocomplete_index() -> Optional[AutocompleteIndex]:
+    """Return the autocomplete index, or None when it is disabled.
+
+    Used as a FastAPI dependency so tests can substitute their own index.
+    """
+    return autocomplete_index
@@ -0,0 +1,107 @@
+"""Benchmark the autocomplete index against the SQL prefix query.
+
+Reports index memory (scaled to one million contacts) and per-lookup latency
+of `AutocompleteIndex.suggest` versus the SQL fallback (`suggest_query`) used
+by `GET /contacts/suggest`, which matches the same name words, emails and
+phone digits.
+Run: python bench_autocomplete.py --contacts 100000 [--database-url sqlite:///./bench.db]
+"""
+# bench_autocomplete.py
+
+import argparse
+import random
+import statistics
+import string
+import tempfile
+import time
+from pathlib import Path
+
+from sqlmodel import SQLModel, Session, create_engine
+
+from autocomplete import AutocompleteIndex, suggest_query
+from models import Contact
+
+FIRST = ["john", "jane", "alex", "maria", "li", "fatima", "omar", "sofia", "ivan", "noah", "emma", "pias"]
+LAST = ["smith", "khan", "garcia", "chen", "müller", "rahman", "okafor", "rossi", "kim", "novak"]
+
+
+def make_rows(count: int, seed: int = 7):
+    rng = random.Random(seed)
+    for i in range(1, count + 1):
+        first, last = rng.choice(FIRST), rng.choice(LAST)
+        suffix = "".join(rng.choices(string.ascii_lowercase, k=3))
+        name = f"{first.title()} {last.title()} {suffix}"
+        email = f"{first}.{last}{i}@example.com"
+        phone = f"+1 ({rng.randint(200, 999)}) {rng.randint(100, 999)}-{rng.randint(0, 9999):04d}"
+        yield i, (name, email, phone)
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    pick = lambda p: ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+    return f"p50={pick(0.5):8.1f}µs  p99={pick(0.99):8.1f}µs  mean={statistics.mean(ordered):8.1f}µs"
+
+
+def time_lookups(fn, prefixes):
+    samples = []
+    for prefix in prefixes:
+        t0 = time.perf_counter()
+        fn(prefix)
+        samples.append((time.perf_counter() - t0) * 1_000_000)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--contacts", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=2_000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--database-url", help="Database for the SQL path (default: temporary SQLite file)")
+    args = parser.parse_args()
+
+    rows = list(make_rows(args.contacts))
+    rng = random.Random(11)
+    prefixes = []
+    for _ in range(args.lookups):
+        _, (name, email, phone) = rng.choice(rows)
+        source = rng.choice([name, email, phone.replace("+", "")])
+        prefixes.append(source[:rng.randint(1, 4)].lower())
+
+    t0 = time.perf_counter()
+    index = AutocompleteIndex(rows)
+    build_seconds = time.perf_counter() - t0
+    stats = index.stats()
+
+    print(f"Contacts: {args.contacts:,}")
+    print(f"Index build: {build_seconds:.2f}s")
+    print(f"Index size: {stats['snapshot_bytes'] / 2 ** 20:.1f} MB, "
+          f"{stats['bytes_per_contact']} B/contact, "
+          f"{stats['mb_per_million_contacts']} MB per million contacts")
+
+    index_samples = time_lookups(lambda p: index.suggest(p, args.limit), prefixes)
+    print(f"Index suggest:  {percentiles(index_samples)}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.database_url or f"sqlite:///{Path(tmp) / 'bench.db'}"
+        engine = create_engine(url, echo=False)
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            session.add_all(Contact(id=cid, name=n, email=e, phone=p) for cid, (n, e, p) in rows)
+            session.commit()
+
+        with Session(engine) as session:
+            def sql_suggest(prefix):
+                query = suggest_query(prefix)
+                if query is None:
+                    return []
+                query = query.order_by(Contact.name.asc(), Contact.id.asc()).limit(args.limit)
+                return session.exec(query).all()
+
+            sql_samples = time_lookups(sql_suggest, prefixes)
+        engine.dispose()
+    print(f"SQL fallback:   {percentiles(sql_samples)}  (same matching rules, full scan)")
+    print(f"Speedup (p50):  {statistics.median(sql_samples) / statistics.median(index_samples):.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,18 +2,22 @@
 
 Creates SQLModel engine and session factory for PostgreSQL database.
 Includes connection validation and error handling.
+Optionally shards contacts across several databases (see `sharding.py`).
 """
 # database.py
 # (1) Create SQLModel engine and session factory, and helper to create tables.
 
 import os
 import sys
-from typing import Generator
+from typing import Generator, Optional
 
 from dotenv import load_dotenv
+from fastapi import Depends
 from sqlmodel import SQLModel, create_engine, Session
 from sqlalchemy.exc import OperationalError
 
+from sharding import ShardRouter, parse_shard_urls
+
 # Load environment variables from .env file
 load_dotenv(dotenv_path=".env")
 
@@ -28,6 +32,10 @@ DATABASE_URL = os.getenv(
     f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 )
 SQLITE_URL = os.getenv("SQLITE_URL", "sqlite:///./app.db")
+# Comma-separated database URLs; when set, contacts are sharded across them
+SHARD_URLS = parse_shard_urls(os.getenv("SHARD_URLS"))
+# Threads for parallel shard queries, shared by all requests (default: shards x pool capacity)
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "0")) or None
 
 # Create SQLAlchemy engine
 # echo=False: Disable SQL query logging (set to True for debugging)
@@ -40,6 +48,9 @@ engine = create_engine(
     max_overflow=10
 )
 
+# Set on startup when SHARD_URLS is configured; None means a single database
+shard_router: Optional[ShardRouter] = None
+
 
 def create_db_and_tables() -> None:
     """Create database tables from SQLModel models.
@@ -50,7 +61,16 @@ def create_db_and_tables() -> None:
     Raises:
         OperationalError: If unable to connect to the database
     """
-    global engine
+    global engine, shard_router
+    if SHARD_URLS:
+        try:
+            shard_router = ShardRouter.from_urls(SHARD_URLS, max_workers=SHARD_WORKERS)
+            shard_router.create_all()
+            print(f"✅ Sharded database initialized across {shard_router.shard_count} shards")
+        except Exception as e:
+            print(f"❌ Failed to initialize shards: {e}")
+            sys.exit(1)
+        return
     try:
         SQLModel.metadata.create_all(engine)
         print("✅ Database tables created/verified successfully")
@@ -99,6 +119,38 @@ def get_session() -> Generator[Session, None, None]:
             session.close()
 
 
+def get_shard_router() -> Optional[ShardRouter]:
+    """Return the shard router, or None when running against a single database.
+    
+    Used as a FastAPI dependency so tests can substitute their own router.
+    """
+    return shard_router
+
+
+def get_contact_session(
+    contact_id: int,
+    session: Session = Depends(get_session),
+    router: Optional[ShardRouter] = Depends(get_shard_router),
+) -> Generator[Session, None, None]:
+    """Yield a session on the database that owns `contact_id`.
+    
+    Without sharding this is the regular request session; with sharding it is
+    a session on the single shard encoded in the contact id.
+    
+    Yields:
+        Session: SQLModel/SQLAlchemy database session
+    """
+    if router is None:
+        yield session
+        return
+    with router.session_for(contact_id) as shard_session:
+        try:
+            yield shard_session
+        except Exception as e:
+            shard_session.rollback()
+            raise e
+
+
 def test_connection() -> bool:
     """Test database connection.
     
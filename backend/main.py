@@ -13,8 +13,13 @@ from fastapi.middleware.cors import CORSMiddleware
 from sqlmodel import select, Session
 from sqlalchemy import or_
 
-from database import create_db_and_tables, get_session
-from models import Contact, ContactCreate, ContactRead, ContactUpdate
+from database import create_db_and_tables, get_contact_session, get_session, get_shard_router
+from autocomplete import (
+    FIELDS, AutocompleteIndex, get_autocomplete_index, init_autocomplete_index, matched_field, suggest_query
+)
+from models import Contact, ContactCreate, ContactRead, ContactSuggestion, ContactUpdate
+from profiling import install_profiling
+from sharding import ShardRouter
 
 
 @asynccontextmanager
@@ -22,6 +27,8 @@ async def lifespan(app: FastAPI):
     """Lifespan context manager for startup and shutdown events."""
     # Startup: Initialize database tables
     create_db_and_tables()
+    # Optional in-memory index for /contacts/suggest (AUTOCOMPLETE_INDEX=1)
+    init_autocomplete_index()
     yield
     # Shutdown: cleanup if needed (currently none)
 
@@ -48,6 +55,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-request profiling (admin-gated or sampled); see profiling.py
+install_profiling(app)
+
 # --- Health Check ---
 
 @app.get("/health", tags=["Health"])
@@ -71,9 +81,14 @@ def list_contacts(
     search: Optional[str] = Query(None, description="Search across name, email, phone"),
     sort_by: str = Query("created_at", description="Sort field: created_at|name|email|id"),
     sort_order: str = Query("desc", description="Sort order: asc|desc"),
-    session: Session = Depends(get_session)
+    session: Session = Depends(get_session),
+    router: Optional[ShardRouter] = Depends(get_shard_router)
 ):
-    """List contacts with pagination, filtering, and sorting."""
+    """List contacts with pagination, filtering, and sorting.
+    
+    With sharding enabled the query runs on every shard in parallel and the
+    per-shard results are merge-sorted on `sort_by` before paginating.
+    """
     query = select(Contact)
 
     if name:
@@ -97,18 +112,64 @@ def list_contacts(
         "id": Contact.id,
     }
     sort_col = sort_field_map.get(sort_by, Contact.created_at)
-    if sort_order.lower() == "asc":
-        query = query.order_by(sort_col.asc())
+    descending = sort_order.lower() != "asc"
+
+    if router is not None:
+        return router.list_contacts(query, sort_col, descending=descending, skip=skip, limit=limit)
+
+    # Contact.id breaks ties so pagination is stable
+    if descending:
+        query = query.order_by(sort_col.desc(), Contact.id.desc())
     else:
-        query = query.order_by(sort_col.desc())
+        query = query.order_by(sort_col.asc(), Contact.id.asc())
 
     query = query.offset(skip).limit(limit)
     contacts = session.exec(query).all()
     return contacts
 
 
+@app.get("/contacts/suggest", response_model=List[ContactSuggestion], tags=["Contacts"])
+def suggest_contacts(
+    prefix: str = Query(..., min_length=1, max_length=100, description="Start of a name, name word, email or phone number"),
+    limit: int = Query(10, ge=1, le=50, description="Maximum number of suggestions to return"),
+    session: Session = Depends(get_session),
+    router: Optional[ShardRouter] = Depends(get_shard_router),
+    index: Optional[AutocompleteIndex] = Depends(get_autocomplete_index)
+):
+    """Suggest contacts whose name, email or phone starts with `prefix`.
+    
+    Served from the in-memory autocomplete index when it is enabled, without
+    touching the database; otherwise falls back to an equivalent SQL query
+    (`suggest_query`). Both match name words and phone digits and group
+    results by the field that matched. With more than `limit` matches the
+    SQL path keeps the first `limit` by name, so it may return a different
+    subset than the index.
+    """
+    if index is not None:
+        return [
+            ContactSuggestion(id=cid, name=name, email=email, phone=phone, matched=matched)
+            for cid, (name, email, phone), matched in index.suggest(prefix, limit)
+        ]
+
+    query = suggest_query(prefix)
+    if query is None:
+        return []
+    if router is not None:
+        contacts = router.list_contacts(query, Contact.name, descending=False, skip=0, limit=limit)
+    else:
+        contacts = session.exec(query.order_by(Contact.name.asc(), Contact.id.asc()).limit(limit)).all()
+
+    suggestions = []
+    for c in contacts:
+        matched = matched_field((c.name, c.email, c.phone), prefix) or "name"
+        suggestions.append(ContactSuggestion(id=c.id, name=c.name, email=c.email, phone=c.phone, matched=matched))
+    # Same grouping as the index: name matches first, then email, then phone
+    suggestions.sort(key=lambda s: FIELDS.index(s.matched))
+    return suggestions
+
+
 @app.get("/contacts/{contact_id}", response_model=ContactRead, tags=["Contacts"])
-def get_contact(contact_id: int, session: Session = Depends(get_session)):
+def get_contact(contact_id: int, session: Session = Depends(get_contact_session)):
     """Get a specific contact by ID.
     
     Args:
@@ -128,7 +189,12 @@ def get_contact(contact_id: int, session: Session = Depends(get_session)):
 
 
 @app.post("/contacts", response_model=ContactRead, status_code=201, tags=["Contacts"])
-def create_contact(contact_in: ContactCreate, session: Session = Depends(get_session)):
+def create_contact(
+    contact_in: ContactCreate,
+    session: Session = Depends(get_session),
+    router: Optional[ShardRouter] = Depends(get_shard_router),
+    index: Optional[AutocompleteIndex] = Depends(get_autocomplete_index)
+):
     """Create a new contact.
     
     Args:
@@ -140,35 +206,52 @@ def create_contact(contact_in: ContactCreate, session: Session = Depends(get_ses
     """
     # Use model_validate instead of deprecated from_orm
     contact = Contact.model_validate(contact_in)
-    session.add(contact)
-    session.commit()
-    session.refresh(contact)
+    if router is not None:
+        contact = router.add_contacts([contact])[0]
+    else:
+        session.add(contact)
+        session.commit()
+        session.refresh(contact)
+    if index is not None:
+        index.upsert(contact)
     return contact
 
 
 @app.post("/contacts/batch", response_model=List[ContactRead], status_code=201, tags=["Contacts"])
-def create_contacts_batch(contacts_in: List[ContactCreate], session: Session = Depends(get_session)):
+def create_contacts_batch(
+    contacts_in: List[ContactCreate],
+    session: Session = Depends(get_session),
+    router: Optional[ShardRouter] = Depends(get_shard_router),
+    index: Optional[AutocompleteIndex] = Depends(get_autocomplete_index)
+):
     """Create multiple contacts in a single request (atomic)."""
     contacts: List[Contact] = []
     for payload in contacts_in:
         contacts.append(Contact.model_validate(payload))
     try:
-        for c in contacts:
-            session.add(c)
-        session.commit()
-        for c in contacts:
-            session.refresh(c)
-        return contacts
+        if router is not None:
+            router.add_contacts(contacts)
+        else:
+            for c in contacts:
+                session.add(c)
+            session.commit()
+            for c in contacts:
+                session.refresh(c)
     except Exception as e:
         session.rollback()
         raise HTTPException(status_code=400, detail=f"Batch creation failed: {e}")
+    if index is not None:
+        for c in contacts:
+            index.upsert(c)
+    return contacts
 
 
 @app.put("/contacts/{contact_id}", response_model=ContactRead, tags=["Contacts"])
 def update_contact(
     contact_id: int,
     contact_in: ContactUpdate,
-    session: Session = Depends(get_session)
+    session: Session = Depends(get_contact_session),
+    index: Optional[AutocompleteIndex] = Depends(get_autocomplete_index)
 ):
     """Update a contact (partial update supported).
     
@@ -195,11 +278,17 @@ def update_contact(
     session.add(contact)
     session.commit()
     session.refresh(contact)
+    if index is not None:
+        index.upsert(contact)
     return contact
 
 
 @app.delete("/contacts/{contact_id}", status_code=204, tags=["Contacts"])
-def delete_contact(contact_id: int, session: Session = Depends(get_session)):
+def delete_contact(
+    contact_id: int,
+    session: Session = Depends(get_contact_session),
+    index: Optional[AutocompleteIndex] = Depends(get_autocomplete_index)
+):
     """Delete a contact.
     
     Args:
@@ -218,4 +307,6 @@ def delete_contact(contact_id: int, session: Session = Depends(get_session)):
     
     session.delete(contact)
     session.commit()
+    if index is not None:
+        index.remove(contact_id)
     return None
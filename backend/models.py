@@ -8,6 +8,7 @@ Defines the Contact table model and related schemas for CRUD operations.
 from datetime import datetime
 from typing import Optional
 from sqlmodel import SQLModel, Field
+from sqlalchemy import BigInteger, Integer
 from pydantic import EmailStr, field_validator
 import re
 
@@ -39,7 +40,13 @@ class ContactBase(SQLModel):
 
 class Contact(ContactBase, table=True):
     """Contact table model with auto-generated ID and timestamp."""
-    id: Optional[int] = Field(default=None, primary_key=True)
+    # BIGINT on Postgres because sharded ids encode their bucket in the low bits;
+    # SQLite keeps INTEGER so the column stays a rowid alias with autoincrement.
+    id: Optional[int] = Field(
+        default=None,
+        primary_key=True,
+        sa_type=BigInteger().with_variant(Integer, "sqlite"),
+    )
     created_at: datetime = Field(default_factory=datetime.utcnow)  # set creation time
 
 class ContactCreate(ContactBase):
@@ -55,3 +62,11 @@ class ContactUpdate(SQLModel):
     name: Optional[str] = None
     phone: Optional[str] = None
     email: Optional[str] = None
+
+class ContactSuggestion(SQLModel):
+    """Schema for an autocomplete suggestion, with the field the prefix matched."""
+    id: int
+    name: str
+    email: str
+    phone: str
+    matched: str
@@ -0,0 +1,445 @@
+"""Per-request profiling with flame-graph output.
+
+A request is profiled when an admin asks for it (header or query flag plus
+token) or when it is picked by random sampling. Profiled requests get a
+stack-sampling profile and per-phase timings; everything else pays only for a
+few attribute checks.
+"""
+# profiling.py
+# (1) Toggle per request:
+#     curl -H "X-Profile: speedscope" -H "X-Profile-Token: $PROFILE_ADMIN_TOKEN" localhost:8000/contacts > p.json
+#     then open p.json at https://www.speedscope.app
+# (2) Or sample: PROFILE_SAMPLE_RATE=0.01 writes 1% of requests to PROFILE_DIR.
+
+import contextvars
+import functools
+import json
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Dict, Generator, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import anyio.to_thread
+import fastapi.dependencies.utils as fastapi_dependencies
+import fastapi.routing as fastapi_routing
+from fastapi import FastAPI
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Phases reported for every profiled request, in request order.
+# `db` is cumulative SQL time and overlaps the phase that issued the queries.
+PHASES = ("dependencies", "validation", "endpoint", "serialization")
+
+# Query flag / header values that return the profile instead of the response body
+INLINE_FORMATS = ("speedscope", "collapsed")
+
+# The profile of the request being handled in this context, if any
+_current_profile: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar(
+    "current_profile", default=None
+)
+
+FrameKey = Tuple[str, int, str]
+
+
+class ProfilingConfig:
+    """Runtime settings for profiling, read from the environment by default.
+
+    Attributes are read on every request, so they can be changed at runtime.
+    """
+
+    def __init__(
+        self,
+        admin_token: Optional[str] = None,
+        sample_rate: Optional[float] = None,
+        output_dir: Optional[str] = None,
+        interval_ms: Optional[float] = None,
+    ):
+        # On-demand profiling is disabled unless an admin token is configured
+        self.admin_token = admin_token if admin_token is not None else os.getenv("PROFILE_ADMIN_TOKEN")
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+        self.output_dir = output_dir if output_dir is not None else os.getenv("PROFILE_DIR", "./profiles")
+        self.interval_ms = interval_ms if interval_ms is not None else float(os.getenv("PROFILE_INTERVAL_MS", "1"))
+
+
+config = ProfilingConfig()
+
+
+def _frame_key(frame) -> FrameKey:
+    code = frame.f_code
+    return (code.co_filename, code.co_firstlineno, getattr(code, "co_qualname", code.co_name))
+
+
+def _stack_until(frame, root) -> Optional[List[FrameKey]]:
+    """Return the stack from `root` down to `frame`, or None if `root` is not on it."""
+    keys: List[FrameKey] = []
+    while frame is not None:
+        keys.append(_frame_key(frame))
+        if frame is root:
+            keys.reverse()
+            return keys
+        frame = frame.f_back
+    return None
+
+
+class RequestProfile:
+    """Stack samples and phase timings collected for a single request."""
+
+    def __init__(self, root_frame, interval_ms: float):
+        self.id = uuid.uuid4().hex[:12]
+        self.started = perf_counter()
+        self.finished: Optional[float] = None
+        self.phases: Dict[str, float] = dict.fromkeys(PHASES, 0.0)
+        self.db_time = 0.0
+        self.db_queries = 0
+        self.samples: List[Tuple[Tuple[FrameKey, ...], float]] = []
+
+        # thread id -> (frame where this request's code starts, stack prefix)
+        self._roots: Dict[int, Tuple[Any, List[FrameKey]]] = {
+            threading.get_ident(): (root_frame, [])
+        }
+        self._loop_root = root_frame
+        self._phase_stack: List[List[Any]] = []
+        self._lock = threading.Lock()
+        self._interval = interval_ms / 1000.0
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, name="profile-sampler", daemon=True)
+
+    # --- Sampling ---
+
+    def start(self) -> None:
+        self._sampler.start()
+
+    def stop(self) -> None:
+        if self.finished is None:
+            self.finished = perf_counter()
+        self._stop.set()
+        self._sampler.join()
+
+    def _sample_loop(self) -> None:
+        last = perf_counter()
+        while not self._stop.wait(self._interval):
+            now = perf_counter()
+            self._take_sample(now - last)
+            last = now
+
+    def _take_sample(self, weight: float) -> None:
+        frames = sys._current_frames()
+        with self._lock:
+            roots = list(self._roots.items())
+        for thread_id, (root, prefix) in roots:
+            frame = frames.get(thread_id)
+            stack = _stack_until(frame, root) if frame is not None else None
+            # The event loop thread may be running another request's task
+            if stack is not None:
+                self.samples.append((tuple(prefix + stack), weight))
+
+    def loop_stack(self, frame) -> List[FrameKey]:
+        """Stack of the request's coroutines on the event loop, ending at `frame`."""
+        return _stack_until(frame, self._loop_root) or []
+
+    def run_in_thread(self, prefix: List[FrameKey], func, /, *args, **kwargs):
+        """Run `func` in a worker thread and sample that thread while it works for this request."""
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._roots[thread_id] = (sys._getframe(), prefix)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._roots.pop(thread_id, None)
+
+    # --- Phase timings ---
+
+    @contextmanager
+    def phase(self, name: str) -> Generator[None, None, None]:
+        """Time a phase; nested phases are subtracted from their parent."""
+        now = perf_counter()
+        if self._phase_stack:
+            parent = self._phase_stack[-1]
+            self.phases[parent[0]] += now - parent[1]
+        self._phase_stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = perf_counter()
+            current, since = self._phase_stack.pop()
+            self.phases[current] += now - since
+            if self._phase_stack:
+                self._phase_stack[-1][1] = now
+
+    def timings_ms(self) -> Dict[str, float]:
+        """Per-phase wall time in milliseconds, plus `db`, `other` and `total`."""
+        end = self.finished if self.finished is not None else perf_counter()
+        total = end - self.started
+        timings = {name: seconds * 1000 for name, seconds in self.phases.items()}
+        timings["db"] = self.db_time * 1000
+        timings["other"] = max(0.0, total - sum(self.phases.values())) * 1000
+        timings["total"] = total * 1000
+        return {name: round(ms, 3) for name, ms in timings.items()}
+
+    def server_timing(self) -> str:
+        """Phase timings formatted as a `Server-Timing` header value."""
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.timings_ms().items())
+
+    # --- Output ---
+
+    def to_collapsed(self) -> str:
+        """Collapsed-stack output (`a;b;c <microseconds>`), as used by flamegraph.pl."""
+        weights: Counter = Counter()
+        for stack, weight in self.samples:
+            weights[stack] += weight
+        lines = []
+        for stack, weight in weights.items():
+            names = ";".join(f"{name} ({os.path.basename(file)}:{line})" for file, line, name in stack)
+            lines.append(f"{names} {max(1, round(weight * 1_000_000))}")
+        return "\n".join(lines) + "\n"
+
+    def to_speedscope(self, name: str = "request") -> Dict[str, Any]:
+        """Sampled profile in speedscope's file format, with phase timings attached."""
+        frame_index: Dict[FrameKey, int] = {}
+        frames: List[Dict[str, Any]] = []
+        samples: List[List[int]] = []
+        weights: List[float] = []
+        for stack, weight in self.samples:
+            indices = []
+            for key in stack:
+                if key not in frame_index:
+                    frame_index[key] = len(frames)
+                    frames.append({"name": key[2], "file": key[0], "line": key[1]})
+                indices.append(frame_index[key])
+            samples.append(indices)
+            weights.append(round(weight * 1000, 3))
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "quickcontacts-profiling",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(sum(weights), 3),
+                "samples": samples,
+                "weights": weights,
+            }],
+            "phases": self.timings_ms(),
+            "db_queries": self.db_queries,
+        }
+
+    def write(self, directory: str, name: str) -> Path:
+        """Write speedscope and collapsed-stack files to `directory`; return the speedscope path."""
+        out = Path(directory)
+        out.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_")
+        stem = f"{time.strftime('%Y%m%dT%H%M%S')}-{slug}-{self.id}"
+        speedscope_path = out / f"{stem}.speedscope.json"
+        speedscope_path.write_text(json.dumps(self.to_speedscope(name)))
+        (out / f"{stem}.collapsed.txt").write_text(self.to_collapsed())
+        return speedscope_path
+
+
+# --- Hooks into FastAPI and SQLAlchemy ---
+
+def _timed_phase(name: str, fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        profile = _current_profile.get()
+        if profile is None:
+            return await fn(*args, **kwargs)
+        with profile.phase(name):
+            return await fn(*args, **kwargs)
+    return wrapper
+
+
+def _sampled_threadpool(fn):
+    @functools.wraps(fn)
+    async def wrapper(func, *args, **kwargs):
+        profile = _current_profile.get()
+        if profile is None:
+            return await fn(func, *args, **kwargs)
+        prefix = profile.loop_stack(sys._getframe())
+        return await fn(profile.run_in_thread, prefix, func, *args, **kwargs)
+    return wrapper
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_profile.get() is not None:
+        conn.info.setdefault("profile_query_start", []).append(perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _finish_query(conn)
+
+
+def _handle_error(exception_context):
+    if exception_context.connection is not None:
+        _finish_query(exception_context.connection)
+
+
+def _finish_query(conn) -> None:
+    profile = _current_profile.get()
+    starts = conn.info.get("profile_query_start")
+    if profile is None or not starts:
+        return
+    elapsed = perf_counter() - starts.pop()
+    with profile._lock:
+        profile.db_time += elapsed
+        profile.db_queries += 1
+
+
+# (module, attribute, wrapper) for each FastAPI internal we hook. These are
+# private names, so a FastAPI upgrade may drop some; those are skipped.
+_HOOK_TARGETS = (
+    (fastapi_routing, "solve_dependencies", lambda fn: _timed_phase("dependencies", fn)),
+    (fastapi_dependencies, "request_body_to_args", lambda fn: _timed_phase("validation", fn)),
+    (fastapi_routing, "run_endpoint_function", lambda fn: _timed_phase("endpoint", fn)),
+    (fastapi_routing, "serialize_response", lambda fn: _timed_phase("serialization", fn)),
+    (fastapi_routing, "run_in_threadpool", _sampled_threadpool),
+    (fastapi_dependencies, "run_in_threadpool", _sampled_threadpool),
+)
+
+_hooks_installed = False
+
+
+def _install_hooks() -> None:
+    """Wrap FastAPI's request phases and listen to SQL execution (idempotent).
+
+    Missing hook targets are skipped with a warning; profiling then simply
+    reports those phases as zero (or under `other`).
+    """
+    global _hooks_installed
+    if _hooks_installed:
+        return
+    _hooks_installed = True
+    for module, name, wrap in _HOOK_TARGETS:
+        original = getattr(module, name, None)
+        if original is None:
+            print(f"⚠️  Profiling: {module.__name__}.{name} not found, skipping its hook")
+            continue
+        setattr(module, name, wrap(original))
+
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+
+
+# --- Middleware ---
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles requests selected by flag or sampling.
+
+    Admins toggle profiling with the `X-Profile` header or `?profile=` query
+    flag, together with an `X-Profile-Token` header matching
+    `config.admin_token`. A value of `speedscope` or `collapsed` returns the
+    profile as the response body; any other value writes it to
+    `config.output_dir`. Profiled responses carry `Server-Timing` and
+    `X-Profile-Id` headers.
+    """
+
+    def __init__(self, app, config: ProfilingConfig = config):
+        self.app = app
+        self.config = config
+
+    def _requested_mode(self, scope) -> Optional[str]:
+        cfg = self.config
+        if cfg.admin_token:
+            requested = _header(scope, b"x-profile")
+            query = scope.get("query_string", b"")
+            if requested is None and b"profile=" in query:
+                requested = parse_qs(query.decode("latin-1")).get("profile", [None])[0]
+            if requested:
+                token = _header(scope, b"x-profile-token") or ""
+                if secrets.compare_digest(token.encode(), cfg.admin_token.encode()):
+                    return requested.lower() if requested.lower() in INLINE_FORMATS else "store"
+        if cfg.sample_rate > 0 and random.random() < cfg.sample_rate:
+            return "store"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        mode = self._requested_mode(scope)
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(sys._getframe(), self.config.interval_ms)
+        inline = mode in INLINE_FORMATS
+        response_status = 500
+
+        async def send_profiled(message):
+            nonlocal response_status
+            if message["type"] == "http.response.start":
+                response_status = message["status"]
+                if inline:
+                    return
+                profile.finished = perf_counter()
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", profile.server_timing().encode()))
+                headers.append((b"x-profile-id", profile.id.encode()))
+                message = {**message, "headers": headers}
+            elif inline:
+                return
+            await send(message)
+
+        token = _current_profile.set(profile)
+        profile.start()
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            profile.stop()
+            _current_profile.reset(token)
+
+        name = f"{scope['method']} {scope['path']}"
+        if not inline:
+            if self.config.output_dir:
+                # The response is already sent; keep encoding and file I/O off the event loop
+                try:
+                    await anyio.to_thread.run_sync(profile.write, self.config.output_dir, name)
+                except Exception as e:
+                    print(f"❌ Failed to write profile {profile.id}: {e}")
+            return
+
+        if mode == "speedscope":
+            body = json.dumps(profile.to_speedscope(name)).encode()
+            media_type = b"application/json"
+        else:
+            body = profile.to_collapsed().encode()
+            media_type = b"text/plain; charset=utf-8"
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", media_type),
+                (b"content-length", str(len(body)).encode()),
+                (b"server-timing", profile.server_timing().encode()),
+                (b"x-profile-id", profile.id.encode()),
+                (b"x-profiled-status", str(response_status).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def install_profiling(app: FastAPI, config: ProfilingConfig = config) -> None:
+    """Install the profiling hooks and middleware on `app`."""
+    _install_hooks()
+    app.add_middleware(ProfilingMiddleware, config=config)
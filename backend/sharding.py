@@ -0,0 +1,502 @@
+"""Hash-partitioned sharding of the contacts table across several databases.
+
+Contact ids carry their own routing information so single-contact lookups go
+straight to one shard, while list queries scatter-gather across all shards.
+"""
+# sharding.py
+# (1) Encode a hash bucket into every contact id and map buckets onto engines.
+# (2) Rebalance rows when the shard list changes:
+#     SHARD_URLS=sqlite:///./s0.db,sqlite:///./s1.db,sqlite:///./s2.db python sharding.py rebalance
+
+import argparse
+import contextvars
+import heapq
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Generator, Iterable, List, Optional, Sequence
+
+from sqlalchemy import BigInteger, Column, Integer, MetaData, String, Table, bindparam, func, insert, update
+from sqlalchemy.engine import Engine
+from sqlmodel import SQLModel, Session, create_engine, select
+
+from models import Contact
+
+# Low bits of every sharded contact id hold its bucket: id = (seq << BUCKET_BITS) | bucket.
+# Buckets are fixed forever; only the persisted bucket -> shard map changes with the shard count.
+BUCKET_BITS = 10
+BUCKET_COUNT = 1 << BUCKET_BITS
+BUCKET_MASK = BUCKET_COUNT - 1
+
+# Sequence numbers are handed out in blocks (hi/lo) so creating a contact
+# does not need a round trip to the primary shard every time.
+ID_BLOCK_SIZE = 1024
+
+# Connection pool of each shard engine. The scatter pool gets enough threads to
+# keep every connection busy, so concurrent requests do not queue behind each other.
+SHARD_POOL_SIZE = 5
+SHARD_MAX_OVERFLOW = 10
+
+# Keep ids below 2**53 so they survive JSON parsing in the browser.
+MAX_CONTACT_ID = (1 << 53) - 1
+
+# The id sequence and bucket map live only on the primary shard, outside
+# SQLModel.metadata, so unsharded deployments never see them. It is a single counter row rather than
+# an autoincrement column so it can be moved forward portably (Postgres serials
+# do not advance past explicitly inserted values).
+sequence_metadata = MetaData()
+contact_id_blocks = Table(
+    "contact_id_block",
+    sequence_metadata,
+    Column("id", Integer, primary_key=True, autoincrement=False),
+    Column("next_block", BigInteger, nullable=False),
+)
+FIRST_ID_BLOCK = 1
+shard_buckets = Table(
+    "shard_bucket",
+    sequence_metadata,
+    Column("bucket", Integer, primary_key=True, autoincrement=False),
+    Column("shard", Integer, nullable=False),
+)
+
+
+def bucket_for_sequence(seq: int) -> int:
+    """Hash a sequence number into a bucket (Fibonacci hashing on 64 bits)."""
+    return ((seq * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> (64 - BUCKET_BITS)
+
+
+def encode_contact_id(seq: int) -> int:
+    """Build a contact id from a globally unique sequence number."""
+    contact_id = (seq << BUCKET_BITS) | bucket_for_sequence(seq)
+    if contact_id > MAX_CONTACT_ID:
+        raise ValueError(f"Contact id sequence exhausted at {seq}")
+    return contact_id
+
+
+def bucket_of(contact_id: int) -> int:
+    """Extract the bucket encoded in a contact id."""
+    return contact_id & BUCKET_MASK
+
+
+def make_engine(url: str) -> Engine:
+    """Create an engine for one shard with the same settings as `database.engine`."""
+    if url.startswith("sqlite"):
+        return create_engine(url, echo=False, connect_args={"check_same_thread": False})
+    return create_engine(
+        url, echo=False, pool_pre_ping=True,
+        pool_size=SHARD_POOL_SIZE, max_overflow=SHARD_MAX_OVERFLOW,
+    )
+
+
+def parse_shard_urls(value: Optional[str]) -> List[str]:
+    """Split a comma-separated `SHARD_URLS` value into a list of database URLs."""
+    if not value:
+        return []
+    return [url.strip() for url in value.split(",") if url.strip()]
+
+
+def plan_bucket_map(current: Sequence[int], shard_count: int) -> List[int]:
+    """Spread the buckets evenly over `shard_count` shards, moving as few as possible.
+
+    Shards that already hold more than their share give up the excess, and
+    buckets on shards beyond `shard_count` are freed; the freed buckets then
+    fill up the shards below their share (e.g. the newly added ones).
+
+    Args:
+        current: Shard index for each bucket
+        shard_count: Number of shards in the new layout
+
+    Returns:
+        List[int]: Shard index for each bucket under the new layout
+    """
+    assignment = list(current)
+    owned: List[List[int]] = [[] for _ in range(shard_count)]
+    freed: List[int] = []
+    for bucket, shard in enumerate(assignment):
+        (owned[shard] if shard < shard_count else freed).append(bucket)
+
+    base, extra = divmod(BUCKET_COUNT, shard_count)
+    # The largest shards keep the odd extra bucket, so fewer rows move
+    by_size = sorted(range(shard_count), key=lambda shard: -len(owned[shard]))
+    quota = {shard: base + (1 if rank < extra else 0) for rank, shard in enumerate(by_size)}
+
+    for shard in range(shard_count):
+        while len(owned[shard]) > quota[shard]:
+            freed.append(owned[shard].pop())
+    freed.sort(reverse=True)
+    for shard in range(shard_count):
+        while len(owned[shard]) < quota[shard]:
+            bucket = freed.pop()
+            assignment[bucket] = shard
+            owned[shard].append(bucket)
+    return assignment
+
+
+def order_for_merge(query, sort_col, descending: bool, dialect: str):
+    """Order `query` by `sort_col` then `Contact.id`, matching Python's comparison order.
+
+    Python compares strings by code point; SQLite's default BINARY collation
+    already does, while Postgres needs an explicit `COLLATE "C"`.
+    """
+    column = sort_col
+    if isinstance(getattr(sort_col.type, "impl", sort_col.type), String) and dialect == "postgresql":
+        column = sort_col.collate("C")
+    if descending:
+        return query.order_by(column.desc(), Contact.id.desc())
+    return query.order_by(column.asc(), Contact.id.asc())
+
+
+class ShardRouter:
+    """Routes contacts to one of N engines by the bucket encoded in their id.
+
+    Buckets are assigned to shards by a map persisted on the primary (shard 0),
+    next to the id sequence, so the primary's position in the list must never
+    change. A fresh cluster starts with bucket `b` on shard `b % N`; `rebalance`
+    later reassigns only the buckets needed to even out a new shard count.
+    """
+
+    def __init__(self, engines: Sequence[Engine], max_workers: Optional[int] = None):
+        """
+        Args:
+            engines: One engine per shard, primary first
+            max_workers: Threads shared by all scatter queries; defaults to the
+                total connection capacity of the shards
+        """
+        if not engines:
+            raise ValueError("ShardRouter needs at least one engine")
+        self.engines: List[Engine] = list(engines)
+        if max_workers is None:
+            max_workers = len(self.engines) * (SHARD_POOL_SIZE + SHARD_MAX_OVERFLOW)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="shard"
+        )
+        self._id_lock = threading.Lock()
+        self._next_seq = 0
+        self._block_end = 0
+        # Replaced by the persisted map in create_all()/assign_buckets()
+        self._bucket_map: List[int] = [bucket % self.shard_count for bucket in range(BUCKET_COUNT)]
+
+    @classmethod
+    def from_urls(cls, urls: Iterable[str], max_workers: Optional[int] = None) -> "ShardRouter":
+        """Build a router with one engine per database URL."""
+        return cls([make_engine(url) for url in urls], max_workers=max_workers)
+
+    @property
+    def shard_count(self) -> int:
+        return len(self.engines)
+
+    def shard_for(self, contact_id: int) -> int:
+        """Return the index of the shard that owns `contact_id`."""
+        return self._bucket_map[bucket_of(contact_id)]
+
+    def _create_tables(self) -> Optional[List[int]]:
+        """Create all tables and seed the id sequence; return the stored bucket map, if any."""
+        for engine in self.engines:
+            SQLModel.metadata.create_all(engine)
+        sequence_metadata.create_all(self.engines[0])
+        with self.engines[0].begin() as conn:
+            exists = conn.execute(select(contact_id_blocks.c.id)).first()
+            if exists is None:
+                conn.execute(insert(contact_id_blocks).values(id=1, next_block=FIRST_ID_BLOCK))
+            rows = conn.execute(select(shard_buckets.c.bucket, shard_buckets.c.shard)).all()
+        if len(rows) != BUCKET_COUNT:
+            return None
+        stored = [0] * BUCKET_COUNT
+        for bucket, shard in rows:
+            stored[bucket] = shard
+        return stored
+
+    def _store_bucket_map(self, assignment: Sequence[int], previous: Optional[Sequence[int]]) -> None:
+        """Persist `assignment`, writing only the buckets that changed."""
+        with self.engines[0].begin() as conn:
+            if previous is None:
+                conn.execute(shard_buckets.delete())
+                conn.execute(
+                    insert(shard_buckets),
+                    [{"bucket": bucket, "shard": shard} for bucket, shard in enumerate(assignment)],
+                )
+                return
+            changed = [
+                {"b": bucket, "s": shard}
+                for bucket, shard in enumerate(assignment)
+                if shard != previous[bucket]
+            ]
+            if changed:
+                conn.execute(
+                    update(shard_buckets)
+                    .where(shard_buckets.c.bucket == bindparam("b"))
+                    .values(shard=bindparam("s")),
+                    changed,
+                )
+
+    def create_all(self) -> None:
+        """Create the contact table on every shard and the id sequence and bucket map on the primary.
+
+        The sequence is moved past any ids already stored on the shards, so
+        contacts copied in from an unsharded database cannot collide.
+
+        Raises:
+            ValueError: If the stored bucket map uses shards that are not
+                configured (run `rebalance` after removing shards)
+        """
+        stored = self._create_tables()
+        if stored is None:
+            self._store_bucket_map(self._bucket_map, None)
+        else:
+            highest = max(stored)
+            if highest >= self.shard_count:
+                raise ValueError(
+                    f"Bucket map assigns buckets to shard {highest} but only "
+                    f"{self.shard_count} shards are configured; run `python sharding.py rebalance`"
+                )
+            self._bucket_map = stored
+        self.reserve_ids_above(self.engines)
+
+    def assign_buckets(self) -> int:
+        """Even out the stored bucket map over the configured shards.
+
+        Only the buckets a new shard needs, or that sat on a removed shard,
+        change owner. Rows are not moved; that is `rebalance`'s job.
+
+        Returns:
+            int: Number of buckets that changed shard
+        """
+        stored = self._create_tables()
+        current = stored if stored is not None else self._bucket_map
+        assignment = plan_bucket_map(current, self.shard_count)
+        self._store_bucket_map(assignment, stored)
+        self._bucket_map = assignment
+        return sum(1 for old, new in zip(current, assignment) if old != new)
+
+    def dispose(self) -> None:
+        """Release pooled connections and worker threads."""
+        self._executor.shutdown(wait=True)
+        for engine in self.engines:
+            engine.dispose()
+
+    @contextmanager
+    def session_for(self, contact_id: int) -> Generator[Session, None, None]:
+        """Open a session on the shard that owns `contact_id`."""
+        with Session(self.engines[self.shard_for(contact_id)]) as session:
+            yield session
+
+    # --- Id allocation ---
+
+    def _allocate_block(self) -> int:
+        """Reserve a new block of sequence numbers on the primary shard."""
+        with self.engines[0].begin() as conn:
+            # The UPDATE row lock serialises concurrent allocators until commit
+            conn.execute(
+                update(contact_id_blocks)
+                .where(contact_id_blocks.c.id == 1)
+                .values(next_block=contact_id_blocks.c.next_block + 1)
+            )
+            next_block = conn.execute(
+                select(contact_id_blocks.c.next_block).where(contact_id_blocks.c.id == 1)
+            ).scalar_one()
+            return next_block - 1
+
+    def reserve_ids_above(self, engines: Iterable[Engine]) -> int:
+        """Move the id sequence past the largest contact id stored in `engines`.
+
+        Legacy ids (1..N from an unsharded database) and ids minted under an
+        older sequence stay valid; new ids are always larger than all of them.
+
+        Returns:
+            int: The next block the sequence will hand out
+        """
+        max_id = 0
+        for engine in engines:
+            with Session(engine) as session:
+                max_id = max(max_id, session.exec(select(func.max(Contact.id))).one() or 0)
+        # Every id minted from sequence `seq` is >= seq << BUCKET_BITS
+        floor = (max_id >> BUCKET_BITS) // ID_BLOCK_SIZE + 1
+        with self.engines[0].begin() as conn:
+            conn.execute(
+                update(contact_id_blocks)
+                .where(contact_id_blocks.c.id == 1, contact_id_blocks.c.next_block < floor)
+                .values(next_block=floor)
+            )
+            next_block = conn.execute(
+                select(contact_id_blocks.c.next_block).where(contact_id_blocks.c.id == 1)
+            ).scalar_one()
+        with self._id_lock:
+            # Drop a cached block that may now sit below the new floor
+            if self._next_seq < floor * ID_BLOCK_SIZE:
+                self._next_seq = self._block_end = 0
+        return next_block
+
+    def allocate_ids(self, count: int) -> List[int]:
+        """Return `count` new, globally unique contact ids."""
+        ids: List[int] = []
+        with self._id_lock:
+            while len(ids) < count:
+                if self._next_seq >= self._block_end:
+                    block = self._allocate_block()
+                    self._next_seq = block * ID_BLOCK_SIZE
+                    self._block_end = self._next_seq + ID_BLOCK_SIZE
+                ids.append(encode_contact_id(self._next_seq))
+                self._next_seq += 1
+        return ids
+
+    # --- Writes ---
+
+    def add_contacts(self, contacts: Sequence[Contact]) -> List[Contact]:
+        """Assign ids to new contacts and insert them on their shards.
+
+        All shards are flushed before any is committed, so validation and
+        constraint errors abort the whole batch. A crash between commits can
+        still leave a partial batch; there is no two-phase commit.
+        """
+        for contact, contact_id in zip(contacts, self.allocate_ids(len(contacts))):
+            contact.id = contact_id
+
+        by_shard: Dict[int, List[Contact]] = {}
+        for contact in contacts:
+            by_shard.setdefault(self.shard_for(contact.id), []).append(contact)
+
+        sessions = {index: Session(self.engines[index]) for index in by_shard}
+        try:
+            for index, group in by_shard.items():
+                sessions[index].add_all(group)
+                sessions[index].flush()
+            for session in sessions.values():
+                session.commit()
+            for index, group in by_shard.items():
+                for contact in group:
+                    sessions[index].refresh(contact)
+            return list(contacts)
+        except Exception:
+            for session in sessions.values():
+                session.rollback()
+            raise
+        finally:
+            for session in sessions.values():
+                session.close()
+
+    # --- Reads ---
+
+    def scatter(self, fn: Callable[[Session], Any]) -> List[Any]:
+        """Run `fn(session)` on every shard in parallel and return the results in shard order."""
+        def run(engine: Engine) -> Any:
+            with Session(engine) as session:
+                return fn(session)
+
+        # Each worker gets a copy of the caller's context (e.g. the active request profile)
+        contexts = [contextvars.copy_context() for _ in self.engines]
+        return list(self._executor.map(lambda ctx, engine: ctx.run(run, engine), contexts, self.engines))
+
+    def list_contacts(
+        self,
+        query,
+        sort_col,
+        descending: bool,
+        skip: int,
+        limit: int,
+    ) -> List[Contact]:
+        """Run a filtered `select(Contact)` on every shard and merge the results.
+
+        Each shard orders by `sort_col` then `Contact.id` and returns at most
+        `skip + limit` rows, which are merge-sorted in Python and sliced. Text
+        columns are compared by code point (`COLLATE "C"` on Postgres) so the
+        shards sort exactly like the merge does.
+        """
+        sort_attr = sort_col.key
+
+        def fetch(session: Session) -> List[Contact]:
+            dialect = session.get_bind().dialect.name
+            ordered = order_for_merge(query, sort_col, descending, dialect)
+            return session.exec(ordered.limit(skip + limit)).all()
+
+        results = self.scatter(fetch)
+        merged = heapq.merge(
+            *results, key=lambda c: (getattr(c, sort_attr), c.id), reverse=descending
+        )
+        return list(merged)[skip:skip + limit]
+
+def rebalance(
+    router: ShardRouter,
+    drain: Sequence[Engine] = (),
+    batch_size: int = 500,
+) -> int:
+    """Move every contact to the shard its bucket maps to under `router`.
+
+    First reassigns buckets to fit `router.shard_count` (see `plan_bucket_map`),
+    so growing from N to N+1 shards moves only about 1/(N+1) of the rows.
+    Then scans all shards of `router` plus any `drain` engines (shards being
+    retired) and moves misplaced rows. Rows are copied before they are deleted,
+    so an interrupted run can simply be restarted. Run it while writes are
+    paused: a row is not reachable by id until it has been moved.
+
+    Returns:
+        int: Number of contacts moved
+    """
+    router.assign_buckets()
+    router.reserve_ids_above([*router.engines, *drain])
+    moved = 0
+    sources = [(index, engine) for index, engine in enumerate(router.engines)]
+    sources += [(None, engine) for engine in drain]
+
+    for source_index, source in sources:
+        last_id = -1
+        while True:
+            with Session(source) as session:
+                rows = session.exec(
+                    select(Contact).where(Contact.id > last_id).order_by(Contact.id).limit(batch_size)
+                ).all()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                misplaced = [row for row in rows if router.shard_for(row.id) != source_index]
+
+                by_target: Dict[int, List[Contact]] = {}
+                for row in misplaced:
+                    by_target.setdefault(router.shard_for(row.id), []).append(row)
+                for target_index, group in by_target.items():
+                    with Session(router.engines[target_index]) as target:
+                        for row in group:
+                            target.merge(Contact.model_validate(row.model_dump()))
+                        target.commit()
+
+                for row in misplaced:
+                    session.delete(row)
+                session.commit()
+                moved += len(misplaced)
+    return moved
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """Command-line entry point for shard maintenance."""
+    parser = argparse.ArgumentParser(description="QuickContacts shard maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebalance_cmd = sub.add_parser(
+        "rebalance", help="Reassign buckets to the given shards and move contacts accordingly"
+    )
+    rebalance_cmd.add_argument(
+        "--shards", default=os.getenv("SHARD_URLS"),
+        help="Comma-separated target shard URLs (default: $SHARD_URLS)",
+    )
+    rebalance_cmd.add_argument(
+        "--drain", action="append", default=[],
+        help="URL of a shard being removed; all of its contacts are moved out (repeatable)",
+    )
+    rebalance_cmd.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    urls = parse_shard_urls(args.shards)
+    if not urls:
+        parser.error("no shards given; pass --shards or set SHARD_URLS")
+    router = ShardRouter.from_urls(urls)
+    drain = [make_engine(url) for url in args.drain]
+    try:
+        moved = rebalance(router, drain=drain, batch_size=args.batch_size)
+        print(f"✅ Rebalanced {moved} contacts across {router.shard_count} shards")
+    finally:
+        router.dispose()
+        for engine in drain:
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
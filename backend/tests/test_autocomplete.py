@@ -0,0 +1,164 @@
+import pytest
+
+from main import app
+from autocomplete import AutocompleteIndex, get_autocomplete_index
+
+ROWS = [
+    (1, ("John Smith", "john@example.com", "+1 (555) 123-4567")),
+    (2, ("Johanna Berg", "jo.berg@example.com", "555-987-6543")),
+    (3, ("Ann Smithers", "ann@corp.io", "5550001111")),
+    (4, ("Zoë Ünal", "zoe@example.com", "5552223333")),
+]
+
+
+def ids(results):
+    return [cid for cid, _, _ in results]
+
+
+@pytest.fixture(scope="function")
+def index():
+    return AutocompleteIndex()
+
+
+@pytest.fixture(scope="function")
+def indexed_client(client, index):
+    app.dependency_overrides[get_autocomplete_index] = lambda: index
+    yield client
+    app.dependency_overrides.pop(get_autocomplete_index, None)
+
+
+def test_prefix_lookup_on_snapshot():
+    idx = AutocompleteIndex(ROWS)
+    assert ids(idx.suggest("joh")) == [2, 1]
+    assert ids(idx.suggest("SMITH")) == [1, 3]
+    assert ids(idx.suggest("jo.")) == [2]
+    assert ids(idx.suggest("+1 (555) 12")) == [1]
+    assert ids(idx.suggest("zoë ü")) == [4]
+    assert idx.suggest("xyz") == []
+    assert len(idx.suggest("5", limit=2)) == 2
+    cid, row, matched = idx.suggest("ann@")[0]
+    assert (cid, row, matched) == (3, ROWS[2][1], "email")
+
+
+def test_repeated_keys_do_not_use_up_limit():
+    rows = [(1, ("Ann Annabel", "a1@example.com", "5550000001")),
+            (2, ("Annie Hall", "a2@example.com", "5550000002"))]
+    assert ids(AutocompleteIndex(rows).suggest("ann", limit=2)) == [1, 2]
+
+    idx = AutocompleteIndex()
+    for cid, row in rows:
+        idx._put(cid, row)
+    assert ids(idx.suggest("ann", limit=2)) == [1, 2]
+
+
+def test_incremental_updates_and_compaction():
+    idx = AutocompleteIndex(ROWS, compact_threshold=1000)
+    idx._put(5, ("Johnny Cash", "cash@example.com", "5554445555"))
+    idx._put(1, ("Jim Smith", "jim@example.com", "5551234567"))
+    idx.remove(2)
+    assert ids(idx.suggest("jo")) == [5]
+    assert ids(idx.suggest("jim")) == [1]
+    assert idx.get(2) is None
+
+    idx.compact()
+    assert idx.stats()["pending_writes"] == 0
+    assert idx.stats()["snapshot_contacts"] == 4
+    assert ids(idx.suggest("jo")) == [5]
+    assert ids(idx.suggest("smith")) == [1, 3]
+
+
+def test_background_compaction_keeps_results():
+    idx = AutocompleteIndex(compact_threshold=8)
+    for i in range(50):
+        idx._put(i, (f"User {i:02d}", f"user{i:02d}@example.com", f"555000{i:04d}"))
+    idx.compact()
+    assert idx.stats()["snapshot_contacts"] == 50
+    assert len(idx.suggest("user", limit=50)) == 50
+    assert ids(idx.suggest("user 1")) == list(range(10, 20))
+
+
+def test_compaction_threshold_scales_with_snapshot():
+    rows = [(i, (f"Base {i}", f"base{i}@example.com", f"555100{i:04d}")) for i in range(1000)]
+    idx = AutocompleteIndex(rows, compact_threshold=8)
+    for i in range(1000, 1099):
+        idx._put(i, (f"New {i}", f"new{i}@example.com", f"555200{i:04d}"))
+    # a tenth of the snapshot, not 8 rows, triggers a rebuild
+    assert idx._compactor is None and idx.stats()["pending_writes"] == 99
+    idx._put(1099, ("New 1099", "new1099@example.com", "5552001099"))
+    idx._compactor.join()
+    assert idx.stats()["snapshot_contacts"] == 1100
+    assert idx.stats()["pending_writes"] == 0
+
+
+def test_failed_compaction_keeps_writes(monkeypatch, capsys):
+    import autocomplete
+    idx = AutocompleteIndex(ROWS, compact_threshold=1000)
+    idx._put(5, ("Johnny Cash", "cash@example.com", "5554445555"))
+    idx.remove(3)
+
+    def broken(rows):
+        raise MemoryError("no room")
+
+    monkeypatch.setattr(autocomplete, "_Snapshot", broken)
+    idx.compact()
+    assert "compaction failed" in capsys.readouterr().out
+    assert idx.stats()["pending_writes"] == 2
+    assert ids(idx.suggest("jo")) == [2, 1, 5]
+    assert idx.get(3) is None
+
+    monkeypatch.undo()
+    idx.compact()
+    assert idx.stats()["pending_writes"] == 0
+    assert ids(idx.suggest("jo")) == [2, 1, 5]
+    assert idx.get(3) is None
+
+
+def test_suggest_endpoint_uses_index(indexed_client, index):
+    r = indexed_client.post("/contacts", json={"name": "Grace Hopper", "email": "grace@navy.mil", "phone": "5551239999"})
+    cid = r.json()["id"]
+    r = indexed_client.get("/contacts/suggest", params={"prefix": "hop"})
+    assert r.status_code == 200
+    assert r.json() == [{"id": cid, "name": "Grace Hopper", "email": "grace@navy.mil",
+                         "phone": "5551239999", "matched": "name"}]
+
+    indexed_client.put(f"/contacts/{cid}", json={"name": "Ada Lovelace"})
+    assert indexed_client.get("/contacts/suggest", params={"prefix": "hop"}).json() == []
+    assert indexed_client.get("/contacts/suggest", params={"prefix": "ada"}).json()[0]["id"] == cid
+
+    indexed_client.delete(f"/contacts/{cid}")
+    assert indexed_client.get("/contacts/suggest", params={"prefix": "ada"}).json() == []
+
+
+def test_suggest_endpoint_sql_fallback(client):
+    batch = [
+        {"name": "Grace Hopper", "email": "grace@navy.mil", "phone": "5551239999"},
+        {"name": "Alan Turing", "email": "alan@bletchley.uk", "phone": "5559876543"},
+    ]
+    client.post("/contacts/batch", json=batch)
+    r = client.get("/contacts/suggest", params={"prefix": "gra"})
+    assert [(s["name"], s["matched"]) for s in r.json()] == [("Grace Hopper", "name")]
+    r = client.get("/contacts/suggest", params={"prefix": "alan@"})
+    assert [(s["name"], s["matched"]) for s in r.json()] == [("Alan Turing", "email")]
+    assert client.get("/contacts/suggest").status_code == 422
+
+
+def test_sql_fallback_matches_index(client):
+    batch = [
+        {"name": "John Smith", "email": "john@example.com", "phone": "+1 (555) 123-4567"},
+        {"name": "Percy 100% Real", "email": "percy_x@example.com", "phone": "555-987-6543"},
+        {"name": "Percy Jackson", "email": "percyx@example.com", "phone": "5550001111"},
+    ]
+    created = client.post("/contacts/batch", json=batch).json()
+    rows = [(c["id"], (c["name"], c["email"], c["phone"])) for c in created]
+    idx = AutocompleteIndex(rows)
+
+    for prefix in ("smi", "15551234", "555 987", "100%", "percy_", "percy", "ex", "%", "_", "(", "john smith"):
+        r = client.get("/contacts/suggest", params={"prefix": prefix})
+        from_sql = [(s["id"], s["matched"]) for s in r.json()]
+        from_index = [(cid, matched) for cid, _, matched in idx.suggest(prefix)]
+        assert sorted(from_sql) == sorted(from_index), prefix
+
+    r = client.get("/contacts/suggest", params={"prefix": "smi"})
+    assert [(s["name"], s["matched"]) for s in r.json()] == [("John Smith", "name")]
+    r = client.get("/contacts/suggest", params={"prefix": "percy_"})
+    assert [s["email"] for s in r.json()] == ["percy_x@example.com"]
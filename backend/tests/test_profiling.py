@@ -0,0 +1,121 @@
+import json
+
+import pytest
+
+import profiling
+
+HEADERS = {"X-Profile-Token": "secret"}
+
+
+@pytest.fixture(autouse=True)
+def profiling_config(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling.config, "admin_token", "secret")
+    monkeypatch.setattr(profiling.config, "sample_rate", 0.0)
+    monkeypatch.setattr(profiling.config, "output_dir", str(tmp_path))
+    return profiling.config
+
+
+def parse_server_timing(header):
+    timings = {}
+    for entry in header.split(","):
+        name, dur = entry.strip().split(";dur=")
+        timings[name] = float(dur)
+    return timings
+
+
+def seed(client, count=50):
+    batch = [{"name": f"P{i}", "email": f"p{i}@example.com", "phone": f"555400{i:04d}"} for i in range(count)]
+    assert client.post("/contacts/batch", json=batch).status_code == 201
+
+
+def test_disabled_by_default(client, tmp_path):
+    r = client.get("/contacts")
+    assert r.status_code == 200
+    assert "server-timing" not in r.headers
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_requires_admin_token(client, tmp_path):
+    r = client.get("/contacts", headers={"X-Profile": "speedscope", "X-Profile-Token": "wrong"})
+    assert r.status_code == 200 and r.json() == []
+    assert "server-timing" not in r.headers
+
+    r = client.get("/contacts", params={"profile": "1"})
+    assert "server-timing" not in r.headers
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_speedscope_inline(client):
+    seed(client)
+    r = client.get("/contacts", params={"profile": "speedscope", "limit": 50}, headers=HEADERS)
+    assert r.status_code == 200
+    assert r.headers["x-profiled-status"] == "200"
+    doc = r.json()
+    assert doc["$schema"].startswith("https://www.speedscope.app")
+    phases = doc["phases"]
+    for name in profiling.PHASES + ("db", "other", "total"):
+        assert name in phases
+    assert phases["db"] > 0 and doc["db_queries"] >= 1
+    assert phases["serialization"] > 0
+    profile = doc["profiles"][0]
+    assert len(profile["samples"]) == len(profile["weights"])
+
+
+def test_collapsed_inline_via_header(client):
+    r = client.post(
+        "/contacts",
+        json={"name": "Flame", "email": "flame@example.com", "phone": "5551112222"},
+        headers={**HEADERS, "X-Profile": "collapsed"},
+    )
+    assert r.status_code == 200
+    assert r.headers["x-profiled-status"] == "201"
+    assert r.headers["content-type"].startswith("text/plain")
+    for line in r.text.splitlines():
+        stack, weight = line.rsplit(" ", 1)
+        assert stack and int(weight) > 0
+    timings = parse_server_timing(r.headers["server-timing"])
+    assert timings["validation"] > 0
+    assert timings["db"] > 0
+
+
+def test_profile_written_to_directory(client, tmp_path):
+    r = client.get("/contacts", headers={**HEADERS, "X-Profile": "1"})
+    assert r.status_code == 200 and r.json() == []
+    assert "endpoint;dur=" in r.headers["server-timing"]
+    profile_id = r.headers["x-profile-id"]
+    written = sorted(p.name for p in tmp_path.iterdir())
+    assert len(written) == 2 and all(profile_id in name for name in written)
+    speedscope = next(tmp_path.glob("*.speedscope.json"))
+    assert json.loads(speedscope.read_text())["name"] == "GET /contacts"
+
+
+def test_sampling(client, profiling_config, tmp_path):
+    profiling_config.sample_rate = 1.0
+    r = client.get("/health")
+    assert r.status_code == 200
+    assert "x-profile-id" in r.headers
+    assert len(list(tmp_path.glob("*.speedscope.json"))) == 1
+
+
+def test_missing_hook_target_is_skipped(monkeypatch, capsys):
+    import types
+    fake = types.ModuleType("fake_fastapi")
+    fake.present = lambda: None
+    monkeypatch.setattr(profiling, "_hooks_installed", False)
+    monkeypatch.setattr(profiling, "_HOOK_TARGETS", (
+        (fake, "missing", profiling._sampled_threadpool),
+        (fake, "present", lambda fn: "wrapped"),
+    ))
+    monkeypatch.setattr(profiling.event, "listen", lambda *args: None)
+    profiling._install_hooks()
+    assert fake.present == "wrapped"
+    assert "fake_fastapi.missing not found" in capsys.readouterr().out
+
+
+def test_write_errors_do_not_fail_request(client, profiling_config, tmp_path, capsys):
+    blocker = tmp_path / "not-a-dir"
+    blocker.write_text("")
+    profiling_config.output_dir = str(blocker)
+    r = client.get("/contacts", headers={**HEADERS, "X-Profile": "1"})
+    assert r.status_code == 200 and r.json() == []
+    assert "Failed to write profile" in capsys.readouterr().out
@@ -0,0 +1,212 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlmodel import Session, select
+from fastapi.testclient import TestClient
+
+from main import app
+from database import get_shard_router
+from models import Contact
+from sqlalchemy.dialects import postgresql
+from sharding import (
+    BUCKET_COUNT, MAX_CONTACT_ID, ShardRouter, bucket_of, encode_contact_id, order_for_merge,
+    plan_bucket_map, rebalance,
+)
+
+
+def make_router(tmp_path, count: int, prefix: str = "shard") -> ShardRouter:
+    router = ShardRouter.from_urls(
+        [f"sqlite:///{tmp_path / f'{prefix}{i}.db'}" for i in range(count)]
+    )
+    router.create_all()
+    return router
+
+
+@pytest.fixture(scope="function")
+def router(tmp_path):
+    r = make_router(tmp_path, 3)
+    yield r
+    r.dispose()
+
+
+@pytest.fixture(scope="function")
+def sharded_client(router):
+    app.dependency_overrides[get_shard_router] = lambda: router
+    with TestClient(app) as c:
+        yield c
+    app.dependency_overrides.clear()
+
+
+def shard_contents(router: ShardRouter):
+    return router.scatter(lambda s: [c.id for c in s.exec(select(Contact)).all()])
+
+
+def test_id_encoding():
+    ids = [encode_contact_id(seq) for seq in range(1024, 1024 + 4096)]
+    assert len(set(ids)) == len(ids)
+    assert all(0 < i <= MAX_CONTACT_ID for i in ids)
+    # buckets spread roughly evenly
+    buckets = {bucket_of(i) for i in ids}
+    assert len(buckets) > 900
+
+
+def test_allocate_ids_unique_across_blocks(router):
+    first = router.allocate_ids(1000)
+    second = router.allocate_ids(1000)
+    assert len(set(first + second)) == 2000
+
+
+def test_concurrent_scatters_run_in_parallel(router):
+    # 4 requests x 3 shards must all be in flight at once to pass the barrier
+    barrier = threading.Barrier(12, timeout=5)
+
+    def fetch(session):
+        barrier.wait()
+        return session.exec(select(Contact)).all()
+
+    with ThreadPoolExecutor(max_workers=4) as requests:
+        results = list(requests.map(lambda _: router.scatter(fetch), range(4)))
+    assert results == [[[], [], []]] * 4
+
+
+def test_sharded_crud_routes_to_one_shard(sharded_client, router):
+    batch = [{"name": f"S{i}", "email": f"s{i}@example.com", "phone": f"555100{i:04d}"} for i in range(30)]
+    r = sharded_client.post("/contacts/batch", json=batch)
+    assert r.status_code == 201
+    created = r.json()
+
+    # every contact lives exactly on the shard its id maps to
+    contents = shard_contents(router)
+    assert sum(len(ids) for ids in contents) == 30
+    assert all(len(ids) > 0 for ids in contents)
+    for index, ids in enumerate(contents):
+        assert all(router.shard_for(i) == index for i in ids)
+
+    cid = created[5]["id"]
+    r = sharded_client.get(f"/contacts/{cid}")
+    assert r.status_code == 200 and r.json()["name"] == "S5"
+
+    r = sharded_client.put(f"/contacts/{cid}", json={"name": "Renamed"})
+    assert r.status_code == 200 and r.json()["name"] == "Renamed"
+
+    r = sharded_client.delete(f"/contacts/{cid}")
+    assert r.status_code == 204
+    assert sharded_client.get(f"/contacts/{cid}").status_code == 404
+
+    r = sharded_client.post("/contacts", json={"name": "Solo", "email": "solo@example.com", "phone": "5559990000"})
+    assert r.status_code == 201
+    assert sharded_client.get(f"/contacts/{r.json()['id']}").json()["name"] == "Solo"
+
+
+def test_sharded_list_merges_in_order(sharded_client):
+    names = [f"N{i:02d}" for i in range(40)]
+    batch = [{"name": n, "email": f"{n.lower()}@example.com", "phone": f"555200{i:04d}"} for i, n in enumerate(names)]
+    assert sharded_client.post("/contacts/batch", json=batch).status_code == 201
+
+    r = sharded_client.get("/contacts", params={"sort_by": "name", "sort_order": "asc", "limit": 100})
+    assert [c["name"] for c in r.json()] == sorted(names)
+
+    r = sharded_client.get("/contacts", params={"sort_by": "name", "sort_order": "desc", "skip": 5, "limit": 10})
+    assert [c["name"] for c in r.json()] == sorted(names, reverse=True)[5:15]
+
+    r = sharded_client.get("/contacts", params={"search": "n1", "sort_by": "id", "sort_order": "asc"})
+    listed = [c["id"] for c in r.json()]
+    assert len(listed) == 10 and listed == sorted(listed)
+
+
+def test_sharded_list_pages_are_stable_with_ties(sharded_client):
+    # same name everywhere: order falls back to id, so pages neither repeat nor drop rows
+    batch = [{"name": "Same", "email": f"same{i}@example.com", "phone": f"555500{i:04d}"} for i in range(25)]
+    assert sharded_client.post("/contacts/batch", json=batch).status_code == 201
+    pages = []
+    for skip in range(0, 25, 7):
+        r = sharded_client.get("/contacts", params={"sort_by": "name", "sort_order": "desc", "skip": skip, "limit": 7})
+        pages.extend(c["id"] for c in r.json())
+    assert pages == sorted(pages, reverse=True) and len(set(pages)) == 25
+
+    # mixed case sorts by code point, as the merge does
+    batch = [{"name": n, "email": f"{n.lower()}@example.org", "phone": "5556660000"} for n in ("alice", "Bob")]
+    sharded_client.post("/contacts/batch", json=batch)
+    r = sharded_client.get("/contacts", params={"sort_by": "name", "sort_order": "asc"})
+    assert [c["name"] for c in r.json()][:2] == ["Bob", "Same"]
+
+
+def test_order_for_merge_uses_c_collation_on_postgres():
+    query = select(Contact)
+    sql = str(order_for_merge(query, Contact.name, True, "postgresql").compile(dialect=postgresql.dialect()))
+    assert 'ORDER BY contact.name COLLATE "C" DESC, contact.id DESC' in sql
+    sql = str(order_for_merge(query, Contact.created_at, False, "postgresql").compile(dialect=postgresql.dialect()))
+    assert "COLLATE" not in sql and "ORDER BY contact.created_at ASC, contact.id ASC" in sql
+
+
+def test_plan_bucket_map_moves_only_the_new_shares():
+    three = [b % 3 for b in range(BUCKET_COUNT)]
+    four = plan_bucket_map(three, 4)
+    changed = [b for b in range(BUCKET_COUNT) if four[b] != three[b]]
+    assert len(changed) == BUCKET_COUNT // 4 and all(four[b] == 3 for b in changed)
+    assert sorted(four.count(s) for s in range(4)) == [256] * 4
+
+    # dropping the last shard only moves its own buckets
+    back = plan_bucket_map(four, 3)
+    assert all(back[b] == four[b] for b in range(BUCKET_COUNT) if four[b] < 3)
+    assert sorted(back.count(s) for s in range(3)) == [341, 341, 342]
+    assert plan_bucket_map(back, 3) == back
+
+
+def test_rebalance_moves_rows_to_new_layout(tmp_path, router):
+    contacts = [Contact(name=f"R{i}", email=f"r{i}@example.com", phone=f"555300{i:04d}") for i in range(300)]
+    ids = [c.id for c in router.add_contacts(contacts)]
+    before = {i: router.shard_for(i) for i in ids}
+
+    # grow from 3 to 4 shards, reusing the existing files as the first three
+    grown = ShardRouter(router.engines + make_router(tmp_path, 1, prefix="extra").engines)
+    moved = rebalance(grown, batch_size=7)
+    contents = shard_contents(grown)
+    assert sorted(i for shard in contents for i in shard) == sorted(ids)
+    for index, shard_ids in enumerate(contents):
+        assert all(grown.shard_for(i) == index for i in shard_ids)
+    # only rows whose bucket went to the new shard moved
+    assert moved == len(contents[3]) and 0 < moved < len(ids) // 2
+    assert all(grown.shard_for(i) in (before[i], 3) for i in ids)
+
+    # the map is persisted: a new router on the same shards routes the same way
+    reopened = ShardRouter(grown.engines)
+    reopened.create_all()
+    assert all(reopened.shard_for(i) == grown.shard_for(i) for i in ids)
+    assert rebalance(reopened) == 0
+
+    # the old 3-shard list no longer matches the stored map
+    with pytest.raises(ValueError, match="rebalance"):
+        ShardRouter(grown.engines[:3]).create_all()
+
+    # shrink to the first 2 shards, draining the rest
+    shrunk = ShardRouter(grown.engines[:2])
+    rebalance(shrunk, drain=grown.engines[2:])
+    contents = shard_contents(shrunk)
+    assert sorted(i for shard in contents for i in shard) == sorted(ids)
+    for engine in grown.engines[2:]:
+        with Session(engine) as s:
+            assert s.exec(select(Contact)).all() == []
+
+
+def test_legacy_ids_do_not_collide_after_drain(tmp_path, router):
+    # an unsharded database with plain ids, including one past the first sharded block
+    legacy = make_router(tmp_path, 1, prefix="legacy").engines[0]
+    legacy_ids = [1, 2, 3, encode_contact_id(1024), encode_contact_id(5000) + 7]
+    with Session(legacy) as s:
+        for i in legacy_ids:
+            s.add(Contact(id=i, name=f"L{i}", email=f"l{i}@example.com", phone="5557770000"))
+        s.commit()
+
+    rebalance(router, drain=[legacy])
+    new_ids = router.allocate_ids(2000)
+    assert min(new_ids) > max(legacy_ids)
+    contacts = [Contact(name=f"N{i}", email=f"n{i}@example.com", phone="5557771111") for i in range(20)]
+    router.add_contacts(contacts)
+    assert sorted(i for shard in shard_contents(router) for i in shard)[:5] == legacy_ids
+
+    # a fresh router on the same shards picks up where the stored ids end
+    again = ShardRouter(router.engines)
+    again.create_all()
+    assert min(again.allocate_ids(1)) > max(new_ids)
@@ -120,7 +120,7 @@ export default function App() {
           </select>
         </div>
       )}
-      <ContactForm onCreate={onCreate} editing={editing} onUpdate={onUpdate} contacts={contacts} />
+      <ContactForm api={API} onCreate={onCreate} editing={editing} onUpdate={onUpdate} contacts={contacts} />
       {message && <div className="message">{message}</div>}
       <ContactList contacts={contacts} onEdit={setEditing} onDelete={onDelete} />
     </div>
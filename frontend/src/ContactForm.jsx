@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from "react";
 
-export default function ContactForm({ onCreate, editing, onUpdate, contacts = [] }) {
+export default function ContactForm({ api, onCreate, editing, onUpdate, contacts = [] }) {
   const [name, setName] = useState("");
   const [phone, setPhone] = useState("");
   const [email, setEmail] = useState("");
@@ -19,9 +19,23 @@ export default function ContactForm({ onCreate, editing, onUpdate, contacts = []
   useEffect(() => {
     const n = name.trim().toLowerCase();
     if (!n) { setKnownNumber(""); return; }
-    const match = contacts.find(c => c.name.toLowerCase() === n);
-    setKnownNumber(match ? match.phone : "");
-  }, [name, contacts]);
+    const local = contacts.find(c => c.name.toLowerCase() === n);
+    if (local || !api) { setKnownNumber(local ? local.phone : ""); return; }
+    // Not in the loaded page: ask the server's prefix index for an exact name match
+    let cancelled = false;
+    const t = setTimeout(async () => {
+      try {
+        const params = new URLSearchParams({ prefix: n, limit: "10" });
+        const res = await fetch(`${api}/contacts/suggest?${params.toString()}`);
+        const data = await res.json();
+        const match = data.find(s => s.name.toLowerCase() === n);
+        if (!cancelled) setKnownNumber(match ? match.phone : "");
+      } catch {
+        if (!cancelled) setKnownNumber("");
+      }
+    }, 150);
+    return () => { cancelled = true; clearTimeout(t); };
+  }, [name, contacts, api]);
 
   const handleSubmit = (e) => {
     e.preventDefault();